@@ -1,31 +1,96 @@
 import os
-import json
+import copy
 import asyncio
 import time
 import io
-from datetime import datetime, timedelta
+import random
+import threading
+from datetime import datetime, timedelta, time as dt_time
+from zoneinfo import ZoneInfo
+import orjson
+from curl_cffi import requests as curl_requests
+from curl_cffi.requests.exceptions import ConnectionError as CurlConnectionError, HTTPError, Timeout
 import discord
 from discord.ext import commands, tasks
 import yfinance as yf
+from yfinance.data import YfData
+from yfinance.exceptions import YFRateLimitError
 import pytz
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
 # Use environment variables for security
 TOKEN = os.getenv('DISCORD_TOKEN')
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'stocks.json')
+CACHE_FILE = os.path.join(os.path.dirname(__file__), 'stock_cache.json')
 
-intents = discord.Intents.default()
+# The bot only reads text commands, so request the minimum intents and skip member/message caches
+intents = discord.Intents.none()
+intents.guilds = True
+intents.guild_messages = True
+intents.dm_messages = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+bot = commands.Bot(
+    command_prefix='!',
+    intents=intents,
+    help_command=None,
+    member_cache_flags=discord.MemberCacheFlags.none(),
+    chunk_guilds_at_startup=False,
+    max_messages=None
+)
 
 # Cache system to reduce API calls
 _cache = {}  # {ticker: (data_dict, timestamp)}
-CACHE_TTL = 60  # seconds
+# {(fetch, ticker): asyncio.Future} for fetches in flight, keyed by fetcher since
+# results differ per fetcher (quotes carry info fields, downloads don't)
+_inflight = {}
+_background_tasks = set()  # keeps background refresh tasks from being garbage collected
+_cache_write_lock = threading.Lock()  # serializes cache file writes from worker threads
+
+# Parsed config, re-read only when stocks.json changes on disk
+_cfg_cache = {"mtime": None, "data": None}
+MIN_CACHE_TTL = 60  # seconds
+
+# Limits for concurrent fetches (keeps us under Yahoo's rate limits)
+FETCH_CONCURRENCY = 8
+FETCH_TIMEOUT = 10  # seconds per request
+
+# One pooled HTTP session shared by every Yahoo request. curl_cffi with browser
+# impersonation is what yfinance expects; plain requests sessions get throttled.
+SESSION = curl_requests.Session(impersonate="chrome")
+
+# Retry settings for Yahoo requests (exponential backoff with jitter)
+RETRY_TRIES = 3
+RETRY_BASE_DELAY = 2  # seconds
+# Transient failures only; other HTTP errors (401, 404, ...) won't fix themselves
+RETRYABLE_ERRORS = (YFRateLimitError, CurlConnectionError, Timeout)
+RETRYABLE_STATUS = 429
+
+# Max tickers per yf.download call
+BATCH_SIZE = 20
+
+# Yahoo's multi-symbol quote endpoint (used for !compare), max symbols per request
+QUOTE_URL = 'https://query1.finance.yahoo.com/v7/finance/quote'
+QUOTE_BATCH_SIZE = 50
+
+# Chart figure is created once and reused; the lock serializes access to it
+plt.style.use('dark_background')
+_fig, _ax = plt.subplots(figsize=(10, 5))
+_chart_lock = asyncio.Lock()
 
 # Eastern timezone for trading hours
 ET = pytz.timezone('America/New_York')
+# pytz zones can't be attached to datetime.time, so the update task uses zoneinfo
+ET_ZONEINFO = ZoneInfo('America/New_York')
+
+# Session boundaries in minutes since midnight ET
+PREMARKET_OPEN = 4 * 60
+REGULAR_OPEN = 9 * 60 + 30
+REGULAR_CLOSE = 16 * 60
+AFTERHOURS_CLOSE = 20 * 60
 
 # Valid interval presets (in minutes)
 INTERVAL_PRESETS = {
@@ -35,26 +100,170 @@ INTERVAL_PRESETS = {
     '2h': 120,
     '4h': 240
 }
+PRESETS_STR = ", ".join(f"`{p}`" for p in INTERVAL_PRESETS)
+
+
+def get_ttl(interval_minutes):
+    """Get the cache TTL in seconds, expiring just before the next scheduled update."""
+    return max(MIN_CACHE_TTL, interval_minutes * 60 - 30)
+
+
+def _cache_lookup(ticker, ttl, full=False, allow_stale=False):
+    """Return (data, is_stale) for a cached ticker, or (None, False) on a miss.
+
+    With allow_stale, entries up to twice the TTL old are still returned
+    (flagged stale) so callers can serve them while refreshing.
+    """
+    if ticker not in _cache:
+        return None, False
+    data, ts = _cache[ticker]
+    # Price-only entries carry no info fields, so they can't serve full lookups
+    if full and 'market_cap' not in data:
+        return None, False
+    age = time.time() - ts
+    if age < ttl:
+        return data, False
+    if allow_stale and age < 2 * ttl:
+        return data, True
+    return None, False
+
+
+def load_cache():
+    """Load the persisted stock cache so restarts don't trigger a full refetch."""
+    global _cache
+    try:
+        with open(CACHE_FILE, 'rb') as f:
+            _cache = {ticker: tuple(entry) for ticker, entry in orjson.loads(f.read()).items()}
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        _cache = {}
+
+
+def save_cache(entries):
+    """Persist a snapshot of the stock cache to disk. Runs in a worker thread."""
+    with _cache_write_lock:
+        tmp_file = CACHE_FILE + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            # yfinance values can be numpy scalars
+            f.write(orjson.dumps(entries, option=orjson.OPT_SERIALIZE_NUMPY))
+        # Atomic swap so a crash mid-write can't leave a corrupt cache file
+        os.replace(tmp_file, CACHE_FILE)
+
+
+async def _cache_store(fetched):
+    """Store {ticker: data} results in the cache, prune expired entries and persist it."""
+    if not fetched:
+        return
+    now = time.time()
+    for ticker, data in fetched.items():
+        # Carried with the data so embeds can show how old cached prices are
+        data["fetched_at"] = now
+        _cache[ticker] = (data, now)
+    # Entries past 2x TTL can't be served even as stale, so stop carrying them
+    max_age = 2 * get_ttl(load_config()["interval_minutes"])
+    for ticker in [t for t, (_, ts) in _cache.items() if now - ts >= max_age]:
+        del _cache[ticker]
+    try:
+        # Write a copy off the event loop so later updates can't change it mid-dump
+        await asyncio.to_thread(save_cache, dict(_cache))
+    except OSError as e:
+        print(f"Error saving cache: {e}")
+
+
+async def _fetch_coalesced(fetch, tickers, now=None):
+    """Fetch tickers in a worker thread, sharing in-flight fetches between callers.
+
+    Returns {ticker: data} for every ticker that was fetched successfully.
+    """
+    loop = asyncio.get_running_loop()
+    waiting = {t: _inflight[(fetch, t)] for t in tickers if (fetch, t) in _inflight}
+    to_fetch = [t for t in tickers if t not in waiting]
+
+    results = {}
+    if to_fetch:
+        futures = {t: loop.create_future() for t in to_fetch}
+        for ticker, future in futures.items():
+            _inflight[(fetch, ticker)] = future
+        try:
+            results = await asyncio.to_thread(fetch, to_fetch, now)
+            await _cache_store(results)
+        finally:
+            # Always resolve so waiters never hang, even if this fetch failed
+            for ticker, future in futures.items():
+                del _inflight[(fetch, ticker)]
+                if not future.done():
+                    future.set_result(results.get(ticker))
+
+    for ticker, future in waiting.items():
+        # Shield so one cancelled waiter doesn't cancel the shared future
+        data = await asyncio.shield(future)
+        if data:
+            results[ticker] = data
+    return results
+
+
+async def _refresh_stocks(fetch, tickers):
+    """Re-fetch tickers in the background and update the cache."""
+    try:
+        await _fetch_coalesced(fetch, tickers)
+    except Exception as e:
+        print(f"Error refreshing {', '.join(tickers)}: {e}")
+
 
+def _schedule_refresh(fetch, tickers):
+    """Start a background refresh for tickers that aren't already being fetched."""
+    tickers = [t for t in tickers if (fetch, t) not in _inflight]
+    if not tickers:
+        return
+    task = asyncio.create_task(_refresh_stocks(fetch, tickers))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def get_cached_stock(ticker):
+    """Get stock data from cache or fetch fresh.
 
-def get_cached_stock(ticker):
-    """Get stock data from cache or fetch fresh."""
+    Stale data is returned immediately while a background refresh runs, and
+    concurrent requests for the same uncached ticker share one fetch.
+    """
     ticker = ticker.upper()
-    if ticker in _cache:
-        data, ts = _cache[ticker]
-        if time.time() - ts < CACHE_TTL:
-            return data
-    # Fetch fresh data
-    data = _fetch_stock_data_raw(ticker)
+    ttl = get_ttl(load_config()["interval_minutes"])
+    data, stale = _cache_lookup(ticker, ttl, allow_stale=True)
     if data:
-        _cache[ticker] = (data, time.time())
-    return data
+        if stale:
+            _schedule_refresh(_fetch_stocks_fast, [ticker])
+        return data
+    # Fetch fresh data
+    fetched = await _fetch_coalesced(_fetch_stocks_fast, [ticker])
+    return fetched.get(ticker)
+
+
+def _is_retryable(e):
+    """True for rate limits, connection/timeout errors and HTTP 429/5xx responses."""
+    if isinstance(e, RETRYABLE_ERRORS):
+        return True
+    status = getattr(e.response, 'status_code', 0) if isinstance(e, HTTPError) else 0
+    return status == RETRYABLE_STATUS or status >= 500
+
+
+def _retry(fn, tries=RETRY_TRIES):
+    """Call fn, retrying transient errors (see _is_retryable) with jittered exponential backoff."""
+    for attempt in range(tries):
+        try:
+            return fn()
+        except (*RETRYABLE_ERRORS, HTTPError) as e:
+            if attempt == tries - 1 or not _is_retryable(e):
+                raise
+            time.sleep(RETRY_BASE_DELAY * 2 ** attempt + random.random())
 
 
 def clear_cache():
     """Clear the stock data cache."""
     global _cache
     _cache = {}
+    try:
+        os.remove(CACHE_FILE)
+    except FileNotFoundError:
+        pass
 
 
 def load_config():
@@ -65,39 +274,55 @@ def load_config():
         "interval_minutes": 60
     }
     try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
+        mtime = os.stat(CONFIG_FILE).st_mtime_ns
+        if mtime == _cfg_cache["mtime"]:
+            # Callers mutate the result, so hand out a copy
+            return copy.deepcopy(_cfg_cache["data"])
+        with open(CONFIG_FILE, 'rb') as f:
+            config = orjson.loads(f.read())
             # Merge with defaults to handle missing keys
             for key, value in defaults.items():
                 if key not in config:
                     config[key] = value
-            return config
-    except (FileNotFoundError, json.JSONDecodeError):
+        _cfg_cache["mtime"] = mtime
+        _cfg_cache["data"] = copy.deepcopy(config)
+        return config
+    except (FileNotFoundError, orjson.JSONDecodeError):
         return defaults
 
 
 def save_config(config):
     """Save configuration to JSON file."""
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=2)
+    with open(CONFIG_FILE, 'wb') as f:
+        f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+    # Update the cache so the next load doesn't re-parse our own write
+    _cfg_cache["mtime"] = os.stat(CONFIG_FILE).st_mtime_ns
+    _cfg_cache["data"] = copy.deepcopy(config)
 
 
-def is_regular_hours():
+def is_regular_hours(now=None):
     """Check if we're within regular market hours (9:30 AM - 4:00 PM ET)."""
-    now = datetime.now(ET)
-    market_open = now.replace(hour=9, minute=30, second=0, microsecond=0)
-    market_close = now.replace(hour=16, minute=0, second=0, microsecond=0)
-    return market_open <= now <= market_close
+    now = now or datetime.now(ET)
+    minute_of_day = now.hour * 60 + now.minute
+    return REGULAR_OPEN <= minute_of_day <= REGULAR_CLOSE
 
 
-def is_trading_hours():
+def is_trading_hours(now=None):
     """Check if we're within extended trading hours (4 AM - 8 PM ET, Mon-Fri)."""
-    now = datetime.now(ET)
+    now = now or datetime.now(ET)
     # Mon=0, Fri=4
-    if now.weekday() > 4:
-        return False
-    # 4 AM to 8 PM ET
-    return 4 <= now.hour < 20
+    minute_of_day = now.hour * 60 + now.minute
+    return now.weekday() < 5 and PREMARKET_OPEN <= minute_of_day < AFTERHOURS_CLOSE
+
+
+def get_extended_label(now=None):
+    """Get the extended hours label ("Pre" or "AH"), or None outside pre/post market."""
+    now = now or datetime.now(ET)
+    if is_regular_hours(now) or not is_trading_hours(now):
+        return None
+    if now.hour * 60 + now.minute < REGULAR_OPEN:
+        return "Pre"
+    return "AH"
 
 
 def get_52w_context(price, year_high, year_low):
@@ -119,14 +344,29 @@ def get_52w_context(price, year_high, year_low):
         return f"{pct_off_high:.0f}% off 52w high"
 
 
-def _fetch_stock_data_raw(ticker):
-    """Fetch stock data using yfinance (internal, use get_cached_stock instead)."""
+def _extended_price_from_bars(bars, today):
+    """Get the latest pre/post market trade from 1m prepost bars, if it's from today."""
+    closes = bars['Close'].dropna()
+    if not len(closes):
+        return None
+    # Only bars outside the regular session count as extended hours trades
+    index = closes.index.tz_convert(ET)
+    minute_of_day = index.hour * 60 + index.minute
+    closes = closes[(minute_of_day < REGULAR_OPEN) | (minute_of_day >= REGULAR_CLOSE)]
+    if len(closes) and closes.index[-1].astimezone(ET).date() == today:
+        return float(closes.iloc[-1])
+    return None
+
+
+def _fetch_stock_data_fast(ticker, now=None):
+    """Fetch price data from fast_info only (internal, use get_cached_stock instead)."""
     try:
-        stock = yf.Ticker(ticker)
+        stock = yf.Ticker(ticker, session=SESSION)
         fast_info = stock.fast_info
         
-        current_price = fast_info.last_price
-        previous_close = fast_info.previous_close
+        current_price, previous_close = _retry(
+            lambda: (fast_info.last_price, fast_info.previous_close)
+        )
         
         if current_price is None or previous_close is None:
             return None
@@ -135,29 +375,19 @@ def _fetch_stock_data_raw(ticker):
         change_percent = (change / previous_close) * 100
         
         # Get 52-week data
-        year_high = getattr(fast_info, 'year_high', None)
-        year_low = getattr(fast_info, 'year_low', None)
-        
-        # Get pre/post market prices from full info
-        info = stock.info
-        pre_market_price = info.get('preMarketPrice')
-        post_market_price = info.get('postMarketPrice')
+        try:
+            year_high = fast_info.year_high
+            year_low = fast_info.year_low
+        except AttributeError:
+            year_high = year_low = None
         
-        # Determine which extended hours price to show
+        # Only look up the extended hours price inside the pre/post market windows
+        now_et = now or datetime.now(ET)
         extended_price = None
-        extended_label = None
-        if not is_regular_hours():
-            now = datetime.now(ET)
-            if now.hour < 9 or (now.hour == 9 and now.minute < 30):
-                # Pre-market
-                if pre_market_price:
-                    extended_price = pre_market_price
-                    extended_label = "Pre"
-            else:
-                # After-hours
-                if post_market_price:
-                    extended_price = post_market_price
-                    extended_label = "AH"
+        extended_label = get_extended_label(now_et)
+        if extended_label:
+            bars = _retry(lambda: stock.history(period='1d', interval='1m', prepost=True))
+            extended_price = _extended_price_from_bars(bars, now_et.date())
         
         return {
             "ticker": ticker.upper(),
@@ -168,28 +398,160 @@ def _fetch_stock_data_raw(ticker):
             "year_low": year_low,
             "fifty_two_week_context": get_52w_context(current_price, year_high, year_low),
             "extended_price": extended_price,
-            "extended_label": extended_label,
-            "market_cap": info.get('marketCap'),
-            "pe_ratio": info.get('trailingPE'),
+            "extended_label": extended_label if extended_price else None,
         }
     except Exception:
         return None
 
 
-def get_stock_data(ticker):
+def _fetch_stocks_fast(tickers, now=None):
+    """Fetch price data for each ticker via fast_info, returning {ticker: data}."""
+    results = {}
+    for ticker in tickers:
+        data = _fetch_stock_data_fast(ticker, now)
+        if data:
+            results[ticker] = data
+    return results
+
+
+def _download_frames(tickers, **kwargs):
+    """Download price history for tickers, returning {ticker: DataFrame}."""
+    hist = yf.download(tickers, group_by='ticker', threads=FETCH_CONCURRENCY,
+                       progress=False, timeout=FETCH_TIMEOUT, session=SESSION,
+                       # Unadjusted prices, matching fast_info and the quote endpoint
+                       auto_adjust=False, repair=False, **kwargs)
+    if hist is None or hist.empty:
+        return {}
+    # Older yfinance versions drop the ticker level for single-ticker downloads
+    if hist.columns.nlevels == 1:
+        return {tickers[0]: hist}
+    return {t: hist[t] for t in tickers if t in hist.columns.get_level_values(0)}
+
+
+def _fetch_stocks_batch(tickers, now=None):
+    """Fetch price data for many tickers with one yf.download call per chunk.
+
+    Only price-derived fields are returned; market cap and P/E come from
+    _batch_quote.
+    """
+    results = {}
+    now_et = now or datetime.now(ET)
+    extended_label = get_extended_label(now_et)
+    today = now_et.date()
+
+    for i in range(0, len(tickers), BATCH_SIZE):
+        chunk = tickers[i:i + BATCH_SIZE]
+        try:
+            frames = _download_frames(chunk, period='1y')
+            intraday = {}
+            if extended_label:
+                # Latest pre/post market trade comes from 1m bars with prepost
+                intraday = _download_frames(chunk, period='1d', interval='1m', prepost=True)
+        except Exception:
+            continue
+
+        for ticker in chunk:
+            frame = frames.get(ticker)
+            if frame is None:
+                continue
+            closes = frame['Close'].dropna()
+            if len(closes) < 2:
+                continue
+
+            current_price = float(closes.iloc[-1])
+            previous_close = float(closes.iloc[-2])
+            change = current_price - previous_close
+            change_percent = (change / previous_close) * 100
+            year_high = float(frame['High'].max())
+            year_low = float(frame['Low'].min())
+
+            extended_price = None
+            if ticker in intraday:
+                extended_price = _extended_price_from_bars(intraday[ticker], today)
+
+            results[ticker] = {
+                "ticker": ticker,
+                "price": current_price,
+                "change": change,
+                "change_percent": change_percent,
+                "year_high": year_high,
+                "year_low": year_low,
+                "fifty_two_week_context": get_52w_context(current_price, year_high, year_low),
+                "extended_price": extended_price,
+                "extended_label": extended_label if extended_price else None,
+            }
+    return results
+
+
+def _batch_quote(tickers, now=None):
+    """Fetch full quotes (including market cap and P/E) for many tickers at once.
+
+    Uses Yahoo's multi-symbol quote endpoint, one request per 50 symbols.
+    """
+    results = {}
+    extended_label = get_extended_label(now)
+    extended_key = {"Pre": "preMarketPrice", "AH": "postMarketPrice"}.get(extended_label)
+
+    for i in range(0, len(tickers), QUOTE_BATCH_SIZE):
+        chunk = tickers[i:i + QUOTE_BATCH_SIZE]
+        try:
+            # YfData handles Yahoo's cookie/crumb handshake for us
+            response = _retry(lambda: YfData(session=SESSION).get_raw_json(
+                QUOTE_URL, params={"symbols": ",".join(chunk), "formatted": "false"}
+            ))
+        except Exception:
+            continue
+
+        for quote in response.get("quoteResponse", {}).get("result") or []:
+            current_price = quote.get("regularMarketPrice")
+            change = quote.get("regularMarketChange")
+            change_percent = quote.get("regularMarketChangePercent")
+            if current_price is None or change is None or change_percent is None:
+                continue
+
+            year_high = quote.get("fiftyTwoWeekHigh")
+            year_low = quote.get("fiftyTwoWeekLow")
+            extended_price = quote.get(extended_key) if extended_key else None
+
+            ticker = quote["symbol"].upper()
+            results[ticker] = {
+                "ticker": ticker,
+                "price": current_price,
+                "change": change,
+                "change_percent": change_percent,
+                "year_high": year_high,
+                "year_low": year_low,
+                "fifty_two_week_context": get_52w_context(current_price, year_high, year_low),
+                "extended_price": extended_price,
+                "extended_label": extended_label if extended_price else None,
+                "market_cap": quote.get("marketCap"),
+                "pe_ratio": quote.get("trailingPE"),
+            }
+    return results
+
+
+async def get_stock_data(ticker):
     """Fetch stock data using cache."""
-    return get_cached_stock(ticker)
+    return await get_cached_stock(ticker)
 
 
-def create_stock_embed(stocks_data):
+def get_data_time(stocks_data, now=None):
+    """Get when the oldest entry in stocks_data was fetched (ET), defaulting to now."""
+    fetched = [d["fetched_at"] for d in stocks_data if d and d.get("fetched_at")]
+    if fetched:
+        return datetime.fromtimestamp(min(fetched), ET)
+    return now or datetime.now(ET)
+
+
+def create_stock_embed(stocks_data, now=None):
     """Create a Discord embed for stock updates with enhanced format."""
-    # Get current ET time for title
-    now_et = datetime.now(ET)
-    time_str = now_et.strftime("%I:%M %p ET")
+    # Title shows when the data was fetched, which is earlier than now if cached
+    data_time = get_data_time(stocks_data, now)
+    time_str = data_time.strftime("%I:%M %p ET")
     
     embed = discord.Embed(
         title=f"📈 Stock Update ({time_str})",
-        timestamp=datetime.now(pytz.UTC),
+        timestamp=data_time.astimezone(pytz.UTC),
         color=discord.Color.blue()
     )
     
@@ -202,50 +564,119 @@ def create_stock_embed(stocks_data):
         if data is None:
             continue
         
-        ticker = data['ticker']
-        
         # Color indicator
-        emoji = "🟢" if data["change"] >= 0 else "🔴"
-        sign = "+" if data["change"] >= 0 else ""
-        
-        # Build price line with optional extended hours price
-        price_str = f"${data['price']:.2f}"
-        if data.get('extended_price') and data.get('extended_label'):
-            price_str += f"  ({data['extended_label']}: ${data['extended_price']:.2f})"
+        if data["change"] >= 0:
+            emoji, sign = "🟢", "+"
+        else:
+            emoji, sign = "🔴", ""
         
-        # First line: ticker and price
-        line = f"{emoji} **{ticker}** — {price_str}\n"
+        # First line: ticker and price, with optional extended hours price
+        parts = [emoji, " **", data['ticker'], "** — $", format(data['price'], '.2f')]
+        extended_price = data.get('extended_price')
+        extended_label = data.get('extended_label')
+        if extended_price and extended_label:
+            parts.extend(("  (", extended_label, ": $", format(extended_price, '.2f'), ")"))
         
         # Second line: change and 52w context
-        change_str = f"{sign}${data['change']:.2f} ({sign}{data['change_percent']:.2f}%)"
+        parts.extend((
+            "\n　　", sign, "$", format(data['change'], '.2f'),
+            " (", sign, format(data['change_percent'], '.2f'), "%)"
+        ))
         context = data.get('fifty_two_week_context')
         if context:
-            line += f"　　{change_str} · {context}"
-        else:
-            line += f"　　{change_str}"
+            parts.extend((" · ", context))
         
-        lines.append(line)
+        lines.append("".join(parts))
     
     embed.description = "\n\n".join(lines) if lines else "No valid stock data."
     return embed
 
 
-async def fetch_all_stocks(tickers):
-    """Fetch data for all stocks."""
-    stocks_data = []
+def _render_chart(hist, ticker, period):
+    """Render a price chart on the shared figure and return it as PNG bytes.
+
+    Callers must hold _chart_lock.
+    """
+    ax = _ax
+    ax.clear()
+    
+    # Plot price line
+    ax.plot(hist.index, hist['Close'], color='#00d4aa', linewidth=2)
+    
+    # Fill under the line
+    ax.fill_between(hist.index, hist['Close'], alpha=0.3, color='#00d4aa')
+    
+    # Formatting
+    ax.set_title(f'{ticker} - {period.upper()}', fontsize=16, fontweight='bold', color='white')
+    ax.set_xlabel('')
+    ax.set_ylabel('Price ($)', fontsize=12, color='white')
+    
+    # Format x-axis dates
+    if period in ['1d', '5d']:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    elif period in ['1mo', '3mo']:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %d'))
+    else:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %Y'))
+    
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(True, alpha=0.3)
+    
+    # Add current price annotation
+    current_price = hist['Close'].iloc[-1]
+    ax.annotate(f'${current_price:.2f}', 
+               xy=(hist.index[-1], current_price),
+               xytext=(10, 0), textcoords='offset points',
+               fontsize=12, color='#00d4aa', fontweight='bold')
+    
+    _fig.tight_layout()
+    
+    # Save to buffer
+    buf = io.BytesIO()
+    _fig.savefig(buf, format='png', dpi=100, facecolor='#2f3136', edgecolor='none')
+    return buf.getvalue()
+
+
+async def fetch_all_stocks(tickers, allow_stale=True, full=False, now=None, max_age=None):
+    """Fetch data for all stocks, batching cache misses into one request.
+
+    With allow_stale, stale cached data is served and refreshed in the background.
+    Pass full=True to include market cap and P/E. max_age (seconds) replaces the
+    interval-aligned TTL for callers that need near-live prices.
+    """
+    tickers = [t.upper() for t in tickers]
+    fetch = _batch_quote if full else _fetch_stocks_batch
+    ttl = max_age if max_age is not None else get_ttl(load_config()["interval_minutes"])
+    results = {}
+    stale = []
     for ticker in tickers:
-        data = get_stock_data(ticker)
-        stocks_data.append(data)
-    return stocks_data
+        data, is_stale = _cache_lookup(ticker, ttl, full, allow_stale)
+        if data:
+            results[ticker] = data
+            if is_stale:
+                stale.append(ticker)
+
+    if stale:
+        _schedule_refresh(fetch, stale)
 
+    missing = [t for t in tickers if t not in results]
+    if missing:
+        results.update(await _fetch_coalesced(fetch, missing, now))
 
-# Global reference to the scheduled task
-scheduled_task = None
+    return [results.get(t) for t in tickers]
 
 
-def get_next_interval_time(interval_minutes):
+def get_update_times(interval_minutes):
+    """Get the aligned update times within trading hours (4 AM - 8 PM ET)."""
+    return [
+        dt_time(hour=minute // 60, minute=minute % 60, tzinfo=ET_ZONEINFO)
+        for minute in range(PREMARKET_OPEN, AFTERHOURS_CLOSE, interval_minutes)
+    ]
+
+
+def get_next_interval_time(interval_minutes, now=None):
     """Calculate the next aligned interval time."""
-    now = datetime.now(ET)
+    now = now or datetime.now(ET)
     
     # Round up to the next interval
     minutes_since_midnight = now.hour * 60 + now.minute
@@ -264,8 +695,9 @@ def get_next_interval_time(interval_minutes):
     return next_time
 
 
-async def run_scheduled_update():
+async def run_scheduled_update(now=None):
     """The actual update logic."""
+    now = now or datetime.now(ET)
     config = load_config()
     channel_id = config.get("channel_id")
     stocks = config.get("stocks", [])
@@ -274,57 +706,47 @@ async def run_scheduled_update():
         return
     
     # Check trading hours
-    if not is_trading_hours():
+    if not is_trading_hours(now):
         return
     
     channel = bot.get_channel(channel_id)
     if not channel:
         return
     
-    stocks_data = await fetch_all_stocks(stocks)
-    embed = create_stock_embed(stocks_data)
+    # Scheduled posts skip the interval-aligned TTL and only reuse prices under a minute old
+    stocks_data = await fetch_all_stocks(stocks, allow_stale=False, now=now, max_age=MIN_CACHE_TTL)
+    embed = create_stock_embed(stocks_data, now)
     await channel.send(embed=embed)
 
 
-async def scheduled_update_loop():
-    """Main loop for scheduled updates with dynamic intervals."""
-    await bot.wait_until_ready()
-    
-    while True:
-        config = load_config()
-        interval_minutes = config.get("interval_minutes", 60)
-        
-        # Calculate wait time until next interval
-        next_time = get_next_interval_time(interval_minutes)
-        now = datetime.now(ET)
-        wait_seconds = (next_time - now).total_seconds()
-        
-        if wait_seconds > 0:
-            print(f"Next update at {next_time.strftime('%I:%M %p ET')} (in {wait_seconds:.0f}s)")
-            await asyncio.sleep(wait_seconds)
-        
-        # Run the update
-        try:
-            await run_scheduled_update()
-        except Exception as e:
-            print(f"Error in scheduled update: {e}")
-        
-        # Small delay to prevent rapid re-runs
-        await asyncio.sleep(5)
+# Set once update_task first fires; current_loop only counts finished runs
+_update_task_fired = False
+
+
+@tasks.loop(time=get_update_times(60))
+async def update_task():
+    """Post a stock update at each aligned interval time."""
+    global _update_task_fired
+    _update_task_fired = True
+    try:
+        await run_scheduled_update(datetime.now(ET))
+    except Exception as e:
+        print(f"Error in scheduled update: {e}")
 
 
-def start_scheduled_task():
-    """Start or restart the scheduled update task."""
-    global scheduled_task
-    if scheduled_task and not scheduled_task.done():
-        scheduled_task.cancel()
-    scheduled_task = asyncio.create_task(scheduled_update_loop())
+@update_task.before_loop
+async def before_update_task():
+    await bot.wait_until_ready()
 
 
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user}')
-    start_scheduled_task()
+    # on_ready fires again on reconnects, so only start the task once
+    if not update_task.is_running():
+        config = load_config()
+        update_task.change_interval(time=get_update_times(config["interval_minutes"]))
+        update_task.start()
 
 
 @bot.command()
@@ -409,7 +831,7 @@ async def addstock(ctx, ticker: str = None):
     
     # Verify the ticker is valid
     await ctx.send(f"🔍 Checking **{ticker}**...")
-    data = get_stock_data(ticker)
+    data = await get_stock_data(ticker)
     
     if data is None:
         await ctx.send(f"❌ Could not find stock data for **{ticker}**. Please check the ticker symbol.")
@@ -462,7 +884,7 @@ async def check(ctx, ticker: str = None):
         # Check single stock
         ticker = ticker.upper()
         await ctx.send(f"🔍 Fetching data for **{ticker}**...")
-        data = get_stock_data(ticker)
+        data = await get_stock_data(ticker)
         
         if data is None:
             await ctx.send(f"❌ Could not find stock data for **{ticker}**.")
@@ -487,20 +909,22 @@ async def check(ctx, ticker: str = None):
 @bot.command()
 async def setinterval(ctx, preset: str = None):
     """Set the update interval. Options: 15m, 30m, 1h, 2h, 4h"""
-    if not preset or preset.lower() not in INTERVAL_PRESETS:
-        presets_str = ", ".join(f"`{p}`" for p in INTERVAL_PRESETS.keys())
-        await ctx.send(f"❌ Please provide a valid interval: {presets_str}")
+    preset = preset.lower() if preset else ''
+    minutes = INTERVAL_PRESETS.get(preset)
+    if minutes is None:
+        await ctx.send(f"❌ Please provide a valid interval: {PRESETS_STR}")
         return
     
-    preset = preset.lower()
-    minutes = INTERVAL_PRESETS[preset]
-    
     config = load_config()
     config["interval_minutes"] = minutes
     save_config(config)
     
-    # Restart the scheduled task with new interval
-    start_scheduled_task()
+    # Reschedule the update task with the new interval
+    update_task.change_interval(time=get_update_times(minutes))
+    if not _update_task_fired:
+        # change_interval only reschedules after the first run, so restart the
+        # still-waiting task instead (restarting mid-run would cancel a post)
+        update_task.restart()
     
     # Calculate next update time
     next_time = get_next_interval_time(minutes)
@@ -523,23 +947,20 @@ async def compare(ctx, *tickers):
     tickers = [t.upper() for t in tickers]
     await ctx.send(f"🔍 Comparing {len(tickers)} stocks...")
     
-    embed = discord.Embed(
-        title="📊 Stock Comparison",
-        color=discord.Color.purple(),
-        timestamp=datetime.utcnow()
-    )
-    
-    # Collect data for all stocks
-    comparison_data = []
-    for ticker in tickers:
-        data = get_stock_data(ticker)
-        if data:
-            comparison_data.append(data)
+    # Collect data for all stocks in a single quote request
+    stocks_data = await fetch_all_stocks(tickers, full=True)
+    comparison_data = [data for data in stocks_data if data]
     
     if not comparison_data:
         await ctx.send("❌ Could not fetch data for any of the provided tickers.")
         return
     
+    embed = discord.Embed(
+        title="📊 Stock Comparison",
+        color=discord.Color.purple(),
+        timestamp=get_data_time(comparison_data).astimezone(pytz.UTC)
+    )
+    
     # Build comparison fields
     # Price row
     prices = " | ".join(f"**{d['ticker']}**: ${d['price']:.2f}" for d in comparison_data)
@@ -607,7 +1028,7 @@ async def chart(ctx, ticker: str = None, period: str = "1mo"):
     await ctx.send(f"🔍 Generating chart for **{ticker}** ({period})...")
     
     try:
-        stock = yf.Ticker(ticker)
+        stock = yf.Ticker(ticker, session=SESSION)
         
         # Determine interval based on period
         interval_map = {
@@ -621,60 +1042,25 @@ async def chart(ctx, ticker: str = None, period: str = "1mo"):
         }
         interval = interval_map.get(period, '1d')
         
-        hist = stock.history(period=period, interval=interval)
+        # Fetch and render in worker threads so the event loop stays responsive
+        hist = await asyncio.to_thread(
+            _retry, lambda: stock.history(period=period, interval=interval)
+        )
         
         if hist.empty:
             await ctx.send(f"❌ No historical data available for **{ticker}**.")
             return
         
-        # Create the chart with dark theme
-        plt.style.use('dark_background')
-        fig, ax = plt.subplots(figsize=(10, 5))
-        
-        # Plot price line
-        ax.plot(hist.index, hist['Close'], color='#00d4aa', linewidth=2)
-        
-        # Fill under the line
-        ax.fill_between(hist.index, hist['Close'], alpha=0.3, color='#00d4aa')
-        
-        # Formatting
-        ax.set_title(f'{ticker} - {period.upper()}', fontsize=16, fontweight='bold', color='white')
-        ax.set_xlabel('')
-        ax.set_ylabel('Price ($)', fontsize=12, color='white')
-        
-        # Format x-axis dates
-        if period in ['1d', '5d']:
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-        elif period in ['1mo', '3mo']:
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %d'))
-        else:
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %Y'))
-        
-        plt.xticks(rotation=45)
-        ax.grid(True, alpha=0.3)
-        
-        # Add current price annotation
-        current_price = hist['Close'].iloc[-1]
-        ax.annotate(f'${current_price:.2f}', 
-                   xy=(hist.index[-1], current_price),
-                   xytext=(10, 0), textcoords='offset points',
-                   fontsize=12, color='#00d4aa', fontweight='bold')
-        
-        plt.tight_layout()
-        
-        # Save to buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=100, facecolor='#2f3136', edgecolor='none')
-        buf.seek(0)
-        plt.close()
+        async with _chart_lock:
+            png = await asyncio.to_thread(_render_chart, hist, ticker, period)
         
         # Send as file
-        file = discord.File(buf, filename=f'{ticker}_chart.png')
+        file = discord.File(io.BytesIO(png), filename=f'{ticker}_chart.png')
         await ctx.send(file=file)
         
     except Exception as e:
         await ctx.send(f"❌ Could not generate chart for **{ticker}**.")
-        plt.close()
 
 
+load_cache()
 bot.run(TOKEN)